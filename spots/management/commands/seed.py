@@ -1,15 +1,66 @@
+import math
 import os
 from decimal import Decimal, InvalidOperation
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+import httpx
 from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
 from spots.models import Spot
 from dotenv import load_dotenv
 
-load_dotenv()
+# 環境變數已有金鑰（例如部署環境或重複 import）時就不再讀 .env
+if not os.environ.get("GOOGLE_API_KEY"):
+    load_dotenv()
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 
 PLACES_SEARCH_URL = "https://places.googleapis.com/v1/places:searchNearby"
-PHOTO_MEDIA_URL_TMPL = "https://places.googleapis.com/v1/{photo_name}/media?maxHeightPx=800&key={api_key}"
+PHOTO_MEDIA_URL_PREFIX = "https://places.googleapis.com/v1/"
+PHOTO_MEDIA_URL_SUFFIX = "/media?maxHeightPx=800&key="
+
+# searchNearby 為唯讀查詢，遇到這些狀態碼可安全重試
+RETRY_STATUSES = {500, 502, 503, 504}
+MAX_RETRIES = 3
+
+# searchNearby 每個中心點最多 3 頁（共 60 筆），再多只能切成多個小圓
+MAX_PAGES = 3
+# 緯度 1 度約 111.32 公里
+METERS_PER_DEGREE = 111320.0
+# --tile 小圓半徑的放大倍率，讓相鄰小圓在大圓邊界上確實重疊
+TILE_OVERLAP = 1.02
+
+# 重跑 seed 時，已存在的景點會以最新資料更新這些欄位
+UPSERT_FIELDS = [
+    "address",
+    "city",
+    "latitude",
+    "longitude",
+    "phone",
+    "url",
+    "rating",
+    "opening_hours",
+    "photo_url",
+]
+
+# 直接寫 SQL 時的欄位順序，save_places 組的 tuple 照這個順序排
+SPOT_COLUMNS = [
+    "name",
+    "address",
+    "city",
+    "latitude",
+    "longitude",
+    "phone",
+    "url",
+    "rating",
+    "place_id",
+    "opening_hours",
+    "description",
+    "photo_url",
+]
+NAME = SPOT_COLUMNS.index("name")
+PLACE_ID = SPOT_COLUMNS.index("place_id")
+OPENING_HOURS = SPOT_COLUMNS.index("opening_hours")
 
 FIELD_MASK = ",".join([
     "places.id",
@@ -25,17 +76,23 @@ FIELD_MASK = ",".join([
     "places.photos",
 ])
 
+# Spot.latitude / longitude 為 decimal_places=6，共用同一個量化單位
+COORD_QUANTUM = Decimal("0.000001")
+
 def to_decimal(val):
+    if val is None:
+        return None
     try:
-        return Decimal(str(val)) if val is not None else None
+        # Decimal(float) 為精確轉換，不必先轉成 str 再解析
+        return Decimal(val).quantize(COORD_QUANTUM)
     except (InvalidOperation, TypeError, ValueError):
         return None
 
 def trim(s, limit):
+    """呼叫端須傳入 str（JSON 字串欄位皆是），不再額外轉型"""
     if not s:
         return None
-    s = str(s)
-    return s[:limit] if len(s) > limit else s
+    return s if len(s) <= limit else s[:limit]
 
 def pick_city(address_components):
     """
@@ -45,39 +102,291 @@ def pick_city(address_components):
     if not address_components:
         return None
     # v1 types 仍包含類似 "locality"/"administrative_area_level_1"
+    # 單次走訪：找到 locality 立即回傳，途中記下第一個 administrative_area_level_1 備用
+    fallback = None
     for comp in address_components:
-        types = comp.get("types", [])
-        name = comp.get("longText") or comp.get("shortText")
-        if "locality" in types and name:
-            return name
-    for comp in address_components:
-        types = comp.get("types", [])
         name = comp.get("longText") or comp.get("shortText")
-        if "administrative_area_level_1" in types and name:
+        if not name:
+            continue
+        types = comp.get("types", ())
+        if "locality" in types:
             return name
-    return None
+        if fallback is None and "administrative_area_level_1" in types:
+            fallback = name
+    return fallback
+
+def tile_centers(lat, lng, radius, n):
+    """
+    以六角格把半徑 radius 的圓切成約 n 個小圓，回傳 [(lat, lng, sub_radius), ...]。
+    n 會進位到完整的六角環數（1、7、19、37…）。
+    """
+    rings = 0
+    while 1 + 3 * rings * (rings + 1) < n:
+        rings += 1
+    if rings == 0:
+        return [(lat, lng, radius)]
+
+    # 相鄰圓心距 sqrt(3)·r 時六角格剛好覆蓋平面。最難覆蓋的方向在最外環兩圓心之間：
+    # 圓心連線距中心 rings·spacing·sqrt(3)/2，兩圓交點再往外 r/2，
+    # 兩者相加要達到 radius，得 r = 2·radius / (3·rings + 1)
+    base_radius = 2 * radius / (3 * rings + 1)
+    spacing = math.sqrt(3) * base_radius
+    # 交點剛好落在大圓上，放大一點吸收平面近似與浮點誤差
+    sub_radius = base_radius * TILE_OVERLAP
+    meters_per_lng = METERS_PER_DEGREE * math.cos(math.radians(lat))
+
+    tiles = []
+    for q in range(-rings, rings + 1):
+        for r in range(max(-rings, -q - rings), min(rings, -q + rings) + 1):
+            x = spacing * (q + r / 2)
+            y = spacing * (r * math.sqrt(3) / 2)
+            tiles.append((lat + y / METERS_PER_DEGREE, lng + x / meters_per_lng, sub_radius))
+    return tiles
+
+def upsert_spots(rows):
+    """
+    以 place_id 為鍵 upsert 多筆 SPOT_COLUMNS 順序的 tuple。
+    直接下一句多列 INSERT ... ON CONFLICT，略過 model 建構；
+    PostgreSQL 與 SQLite（core/settings.py 僅支援這兩者）皆適用。
+    """
+    qn = connection.ops.quote_name
+    json_prep = Spot._meta.get_field("opening_hours").get_db_prep_save
+    placeholder = "(" + ", ".join(["%s"] * len(SPOT_COLUMNS)) + ")"
+    sql_prefix = "INSERT INTO {} ({}) VALUES ".format(
+        qn(Spot._meta.db_table), ", ".join(qn(c) for c in SPOT_COLUMNS)
+    )
+    sql_suffix = " ON CONFLICT ({}) DO UPDATE SET {}".format(
+        qn("place_id"), ", ".join(f"{qn(c)} = EXCLUDED.{qn(c)}" for c in UPSERT_FIELDS)
+    )
+    # SQLite 有參數數量上限，依欄位數切批
+    max_params = connection.features.max_query_params
+    chunk = min(500, max_params // len(SPOT_COLUMNS)) if max_params else 500
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), chunk):
+            part = rows[start:start + chunk]
+            params = []
+            for row in part:
+                params.extend(row[:OPENING_HOURS])
+                params.append(json_prep(row[OPENING_HOURS], connection))
+                params.extend(row[OPENING_HOURS + 1:])
+            cursor.execute(sql_prefix + ", ".join([placeholder] * len(part)) + sql_suffix, params)
 
 class Command(BaseCommand):
     help = "以 Google Places API v1 取得台灣熱門觀光景點，寫入 spots_spot"
 
+    # 同時打 API 的中心點數量上限，避免超過 Places QPS
+    max_workers = 4
+
     def add_arguments(self, parser):
         parser.add_argument("--lat", type=float, default=25.0330, help="中心點緯度（預設台北101）")
         parser.add_argument("--lng", type=float, default=121.5654, help="中心點經度（預設台北101）")
+        parser.add_argument(
+            "--center",
+            action="append",
+            default=None,
+            help="額外中心點「緯度,經度」，可重複指定；有指定時取代 --lat/--lng 並同時抓取",
+        )
         parser.add_argument("--radius", type=float, default=50000.0, help="搜尋半徑（公尺）")
-        parser.add_argument("--pages", type=int, default=1, help="抓取頁數（每頁最多20筆）")
+        parser.add_argument("--pages", type=int, default=1, help="抓取頁數（每頁最多20筆，最多3頁）")
+        parser.add_argument(
+            "--tile",
+            type=int,
+            default=1,
+            help="把每個中心點的搜尋圓切成約 N 個小圓同時抓取，用來突破每圓 60 筆的上限",
+        )
 
     def handle(self, *args, **opts):
-        api_key = os.getenv("GOOGLE_API_KEY")
+        api_key = GOOGLE_API_KEY
         if not api_key:
             self.stderr.write(self.style.ERROR("缺少 GOOGLE_API_KEY 環境變數"))
             return
 
+        if opts["center"]:
+            centers = []
+            try:
+                for c in opts["center"]:
+                    lat, lng = c.split(",")
+                    centers.append((float(lat), float(lng)))
+            except ValueError:
+                self.stderr.write(self.style.ERROR("--center 格式應為「緯度,經度」"))
+                return
+        else:
+            centers = [(float(opts["lat"]), float(opts["lng"]))]
+
+        pages = opts["pages"]
+        if pages > MAX_PAGES:
+            self.stdout.write(self.style.WARNING(f"每個中心點最多 {MAX_PAGES} 頁，超過的部分請改用 --tile"))
+            pages = MAX_PAGES
+
+        circles = [
+            tile
+            for lat, lng in centers
+            for tile in tile_centers(lat, lng, float(opts["radius"]), opts["tile"])
+        ]
+
+        # api_key 整次執行不變，先組好照片網址的後半段
+        photo_suffix = PHOTO_MEDIA_URL_SUFFIX + api_key
+
         headers = {
             "Content-Type": "application/json",
             "X-Goog-Api-Key": api_key,
             "X-Goog-FieldMask": FIELD_MASK,
         }
 
+        # HTTP/2：所有中心點、分頁的請求多工共用同一條 TLS 連線
+        client = httpx.Client(
+            headers=headers,
+            timeout=30.0,
+            transport=httpx.HTTPTransport(http2=True, retries=MAX_RETRIES),
+        )
+
+        # 各搜尋圓彼此獨立，同時抓取；同一個圓的分頁仍需依序。
+        # 不同圓、不同頁重複的景點由 seen 在寫入前濾掉。
+        # 每頁抓到後交給單一 writer thread 寫入，與換頁前的等待重疊
+        writes = []
+        # 整次執行已處理過的 place_id；只在 writer thread 內讀寫，不需加鎖
+        seen = set()
+        with client, \
+                ThreadPoolExecutor(max_workers=1) as writer, \
+                ThreadPoolExecutor(max_workers=min(self.max_workers, len(circles))) as executor:
+
+            def queue_page(page):
+                writes.append(writer.submit(self.write_page, page, photo_suffix, seen))
+
+            try:
+                list(executor.map(
+                    lambda circle: self.fetch_places(client, circle, pages, queue_page),
+                    circles,
+                ))
+            finally:
+                # writer thread 依序執行，排在最後關掉它自己的 DB 連線；抓取失敗也要關
+                writer.submit(connection.close)
+
+        results = [w.result() for w in writes]
+        saved = sum(r[0] for r in results if r)
+        skipped = sum(r[1] for r in results if r)
+        failed = sum(1 for r in results if r is None)
+        if failed:
+            self.stdout.write(self.style.WARNING(f"完成。新增 {saved} 筆，略過 {skipped} 筆，{failed} 頁寫入失敗"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"完成。新增 {saved} 筆，略過 {skipped} 筆"))
+
+    def write_page(self, places, photo_suffix, seen):
+        """在 writer thread 寫入一頁；失敗時當下回報並回傳 None，不影響其他頁"""
+        try:
+            return self.save_places(places, photo_suffix, seen)
+        except DatabaseError as e:
+            self.stderr.write(self.style.ERROR(f"本頁 {len(places)} 筆寫入失敗：{e}"))
+            # 整頁已 rollback，讓之後頁面中的同一批景點還有機會寫入
+            seen.difference_update(p.get("id") for p in places)
+            return None
+
+    def save_places(self, places, photo_suffix, seen):
+        """
+        將一頁 places 寫入 spots_spot（以 place_id upsert），回傳 (新增筆數, 略過筆數)。
+        seen 為本次執行已處理過的 place_id，會就地更新。
+        """
+        skipped = 0
+        batch = []
+        # 迴圈內大量 .get，先綁成區域變數省去每次的屬性查找
+        dg = dict.get
+
+        for p in places:
+            # place_id 是 upsert 的鍵，沒有就無法寫入；本次執行已處理過的也不再碰 DB
+            pid = dg(p, "id")
+            if not pid or pid in seen:
+                skipped += 1
+                continue
+            seen.add(pid)
+
+            # 巢狀欄位先綁成區域變數，避免反覆建立空 dict
+            display_name = dg(p, "displayName")
+            location = dg(p, "location")
+            current_hours = dg(p, "currentOpeningHours")
+
+            # 名稱（中文）
+            name = (dg(display_name, "text") if display_name else None) or ""
+            if not name:
+                skipped += 1
+                continue
+            if len(name) > 1000:
+                name = name[:1000]
+
+            # 地址（中文）
+            address = dg(p, "formattedAddress") or dg(p, "shortFormattedAddress") or None
+            address = trim(address, 255)
+
+            # 城市
+            city = pick_city(dg(p, "addressComponents")) or None
+            city = trim(city, 100)
+
+            # 經緯度
+            lat = to_decimal(dg(location, "latitude") if location else None)
+            lng = to_decimal(dg(location, "longitude") if location else None)
+
+            # 電話、網址、評分
+            phone = trim(dg(p, "nationalPhoneNumber"), 20)
+            website = trim(dg(p, "websiteUri"), 500)
+            rating = dg(p, "rating", None)
+
+            # 營業時間（JSONField，直接存 list）
+            opening_hours = None
+            weekday_desc = dg(current_hours, "weekdayDescriptions") if current_hours else None
+            if weekday_desc:
+                opening_hours = weekday_desc  # list[str]
+
+            # 照片：取第一張
+            photo_url = None
+            photos = dg(p, "photos") or []
+            if photos:
+                photo_name = dg(photos[0], "name")  # e.g. "places/xxx/photos/yyy"
+                if photo_name:
+                    # 直接可用的圖片連結（Google 會回傳實體圖）
+                    photo_url = PHOTO_MEDIA_URL_PREFIX + photo_name + photo_suffix
+                    photo_url = trim(photo_url, 500)
+
+            # place_id
+            place_id = trim(pid, 255)
+
+            # 依 SPOT_COLUMNS 順序；description 為 None，v1 沒有 editorial_summary，可自行補抓 Place Details v1
+            batch.append((
+                name, address, city, lat, lng, phone, website, rating,
+                place_id, opening_hours, None, photo_url,
+            ))
+
+        if not batch:
+            return 0, skipped
+
+        incoming_ids = [row[PLACE_ID] for row in batch]
+        # 一次查出已存在的 place_id，這些會被更新而不算新增
+        existing = set(
+            Spot.objects.filter(place_id__in=incoming_ids).values_list("place_id", flat=True)
+        )
+        # name 仍為 unique，且 upsert 不會更新既有列的 name：
+        # 新景點的名稱只要已存在於 DB（不論屬於哪個 place_id）或同頁已有人用，就只能略過
+        new_names = [row[NAME] for row in batch if row[PLACE_ID] not in existing]
+        taken_names = set(
+            Spot.objects.filter(name__in=new_names).values_list("name", flat=True)
+        )
+        rows = []
+        for row in batch:
+            if row[PLACE_ID] not in existing:
+                if row[NAME] in taken_names:
+                    skipped += 1
+                    continue
+                taken_names.add(row[NAME])
+            rows.append(row)
+
+        # 整頁一次 upsert 並只 commit 一次
+        with transaction.atomic():
+            upsert_spots(rows)
+
+        saved = sum(1 for row in rows if row[PLACE_ID] not in existing)
+        return saved, skipped
+
+    def fetch_places(self, client, circle, pages, on_page):
+        """依序抓取單一搜尋圓 (lat, lng, radius) 的各頁結果，每頁交給 on_page 處理"""
         body = {
             "languageCode": "zh-TW",
             "regionCode": "TW",
@@ -87,99 +396,46 @@ class Command(BaseCommand):
             "locationRestriction": {
                 "circle": {
                     "center": {
-                        "latitude": float(opts["lat"]),
-                        "longitude": float(opts["lng"]),
+                        "latitude": circle[0],
+                        "longitude": circle[1],
                     },
-                    "radius": float(opts["radius"]),
+                    "radius": circle[2],
                 }
             },
         }
 
-        saved, skipped = 0, 0
+        # 先序列化一次，只有換頁（pageToken 改變）時才重新編碼
+        content = orjson.dumps(body)
         next_page_token = None
 
-        for _ in range(max(1, opts["pages"])):
+        for _ in range(max(1, pages)):
             if next_page_token:
                 body["pageToken"] = next_page_token
+                content = orjson.dumps(body)
 
-            resp = requests.post(PLACES_SEARCH_URL, json=body, headers=headers, timeout=30)
+            try:
+                for attempt in range(MAX_RETRIES + 1):
+                    resp = client.post(PLACES_SEARCH_URL, content=content)
+                    if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                        break
+                    time.sleep(0.3 * 2 ** attempt)
+            except httpx.HTTPError as e:
+                self.stderr.write(self.style.ERROR(f"API 連線錯誤：{e!r}"))
+                break
             if resp.status_code != 200:
                 self.stderr.write(self.style.ERROR(f"API 錯誤 {resp.status_code}: {resp.text[:300]}"))
                 break
 
-            payload = resp.json()
-            places = payload.get("places", []) or []
-            self.stdout.write(f"本頁取得 {len(places)} 筆")
-
-            for p in places:
-                # 名稱（中文）
-                name = (p.get("displayName") or {}).get("text") or ""
-                if not name:
-                    skipped += 1
-                    continue
-                if len(name) > 1000:
-                    name = name[:1000]
-
-                # 地址（中文）
-                address = p.get("formattedAddress") or p.get("shortFormattedAddress") or None
-                address = trim(address, 255)
-
-                # 城市
-                city = pick_city(p.get("addressComponents")) or None
-                city = trim(city, 100)
-
-                # 經緯度
-                lat = to_decimal(((p.get("location") or {}).get("latitude")))
-                lng = to_decimal(((p.get("location") or {}).get("longitude")))
-
-                # 電話、網址、評分
-                phone = trim(p.get("nationalPhoneNumber"), 20)
-                website = trim(p.get("websiteUri"), 500)
-                rating = p.get("rating", None)
-
-                # 營業時間（JSONField，直接存 list）
-                opening_hours = None
-                current_hours = (p.get("currentOpeningHours") or {})
-                weekday_desc = current_hours.get("weekdayDescriptions")
-                if weekday_desc:
-                    opening_hours = weekday_desc  # list[str]
-
-                # 照片：取第一張
-                photo_url = None
-                photos = p.get("photos") or []
-                if photos:
-                    photo_name = photos[0].get("name")  # e.g. "places/xxx/photos/yyy"
-                    if photo_name:
-                        # 直接可用的圖片連結（Google 會回傳實體圖）
-                        photo_url = PHOTO_MEDIA_URL_TMPL.format(photo_name=photo_name, api_key=api_key)
-                        photo_url = trim(photo_url, 500)
-
-                # place_id
-                place_id = trim(p.get("id"), 255)
-
-                obj, created = Spot.objects.get_or_create(
-                    name=name,
-                    defaults={
-                        "address": address,
-                        "city": city,
-                        "latitude": lat,
-                        "longitude": lng,
-                        "phone": phone,
-                        "url": website,
-                        "rating": rating,
-                        "place_id": place_id,
-                        "opening_hours": opening_hours,
-                        "description": None,  # v1 沒有 editorial_summary，可自行補抓 Place Details v1
-                        "photo_url": photo_url,
-                    },
-                )
-                if created:
-                    saved += 1
+            # 目前 FIELD_MASK 下每頁只有 20 筆、數 KB，整包解析即可；
+            # 若之後加入 reviews、全部 photos 等大欄位，可改用 client.stream + ijson
+            # 逐筆解析 places.item（注意 nextPageToken 位在 places 之後）
+            payload = orjson.loads(resp.content)
+            page = payload.get("places", []) or []
+            self.stdout.write(f"本頁取得 {len(page)} 筆")
+            on_page(page)
 
             next_page_token = payload.get("nextPageToken")
             if not next_page_token:
                 break
             # 官方建議等個 2 秒再拿下一頁
             time.sleep(2)
-
-        self.stdout.write(self.style.SUCCESS(f"完成。新增 {saved} 筆，略過 {skipped} 筆"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-15 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spots', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='spot',
+            name='place_id',
+            field=models.CharField(db_index=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-15 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spots', '0002_alter_spot_place_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='spot',
+            name='place_id',
+            field=models.CharField(max_length=255, null=True, unique=True),
+        ),
+    ]
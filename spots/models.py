@@ -19,7 +19,7 @@ class Spot(models.Model):
     rating = models.FloatField(
         null=True, validators=[MinValueValidator(0.0), MaxValueValidator(5.0)]
     )
-    place_id = models.CharField(max_length=255, null=True)
+    place_id = models.CharField(max_length=255, null=True, unique=True)
     opening_hours = models.JSONField(null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     photo_url = models.URLField(max_length=500, null=True, blank=True)
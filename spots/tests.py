@@ -1,3 +1,79 @@
-from django.test import TestCase
+import math
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+
+from spots.management.commands.seed import Command, tile_centers
+from spots.models import Spot
+
+EARTH_RADIUS = 6371008.8
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    h = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
+
+
+def destination(lat, lng, distance, bearing):
+    d = distance / EARTH_RADIUS
+    b = math.radians(bearing)
+    p1, l1 = math.radians(lat), math.radians(lng)
+    p2 = math.asin(math.sin(p1) * math.cos(d) + math.cos(p1) * math.sin(d) * math.cos(b))
+    l2 = l1 + math.atan2(
+        math.sin(b) * math.sin(d) * math.cos(p1), math.cos(d) - math.sin(p1) * math.sin(p2)
+    )
+    return math.degrees(p2), math.degrees(l2)
+
+
+class TileCentersTest(SimpleTestCase):
+    lat, lng = 25.0330, 121.5654
+
+    def test_single_tile_is_whole_circle(self):
+        self.assertEqual(tile_centers(self.lat, self.lng, 10000, 1), [(self.lat, self.lng, 10000)])
+
+    def test_rounds_up_to_full_rings(self):
+        self.assertEqual(len(tile_centers(self.lat, self.lng, 10000, 2)), 7)
+        self.assertEqual(len(tile_centers(self.lat, self.lng, 10000, 8)), 19)
+
+    def test_tiles_cover_search_circle(self):
+        for radius in (10000, 50000):
+            for n in (7, 19, 37):
+                tiles = tile_centers(self.lat, self.lng, radius, n)
+                for fraction in (1.0, 0.9, 0.5):
+                    for bearing in range(360):
+                        point = destination(self.lat, self.lng, radius * fraction, bearing)
+                        with self.subTest(radius=radius, n=n, fraction=fraction, bearing=bearing):
+                            self.assertTrue(
+                                any(haversine(*point, t_lat, t_lng) <= r for t_lat, t_lng, r in tiles)
+                            )
+
+
+class SavePlacesTest(TestCase):
+    def test_renamed_place_keeps_name_taken(self):
+        Spot.objects.create(name="Foo", place_id="A")
+        places = [
+            {"id": "A", "displayName": {"text": "Foo2"}},
+            {"id": "D", "displayName": {"text": "Foo"}},
+        ]
+
+        saved, skipped = Command().save_places(places, "", set())
+
+        self.assertEqual((saved, skipped), (0, 1))
+        self.assertEqual(Spot.objects.get(place_id="A").name, "Foo")
+        self.assertFalse(Spot.objects.filter(place_id="D").exists())
+
+    def test_failed_page_is_reported_and_released(self):
+        command = Command(stdout=StringIO(), stderr=StringIO())
+        seen = set()
+        places = [{"id": "A", "displayName": {"text": "Foo"}}]
+
+        with mock.patch.object(Spot.objects, "filter", side_effect=DatabaseError("boom")):
+            self.assertIsNone(command.write_page(places, "", seen))
+
+        self.assertIn("boom", command.stderr.getvalue())
+        self.assertEqual(seen, set())
+        self.assertEqual(command.write_page(places, "", seen), (1, 0))
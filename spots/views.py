@@ -219,22 +219,27 @@ class SearchView(View):
                     if "photos" in details and len(details["photos"]) > 0
                     else None
                 )
-                spot, created = Spot.objects.get_or_create(
-                    name=name,
-                    defaults={
-                        "address": address,
-                        "city": city,
-                        "latitude": location["lat"],
-                        "longitude": location["lng"],
-                        "phone": phone,
-                        "url": url,
-                        "rating": rating,
-                        "place_id": place_id,
-                        "opening_hours": formatted_weekday_text,
-                        "description": description,
-                        "photo_url": photo_url,
-                    },
+                # place_id 與 name 皆為 unique；seed 寫入的名稱可能和這裡轉換後的不同，
+                # 先以 place_id 找，再以名稱找，都沒有才新增
+                spot = (
+                    Spot.objects.filter(place_id=place_id).first()
+                    or Spot.objects.filter(name=name).first()
                 )
+                if spot is None:
+                    spot = Spot.objects.create(
+                        name=name,
+                        address=address,
+                        city=city,
+                        latitude=location["lat"],
+                        longitude=location["lng"],
+                        phone=phone,
+                        url=url,
+                        rating=rating,
+                        place_id=place_id,
+                        opening_hours=formatted_weekday_text,
+                        description=description,
+                        photo_url=photo_url,
+                    )
 
                 result = {
                     "名稱": spot.name,